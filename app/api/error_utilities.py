@@ -29,6 +29,12 @@ class ToolExecutorError(Exception):
         self.message = message
         super().__init__(self.message)
 
+class CacheMissError(Exception):
+    """Raised when the LLM cache runs in replay mode and a response is not cached."""
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
 class ErrorResponse(BaseModel):
     """Base model for error responses."""
     status: int
@@ -33,12 +33,12 @@ async def submit_tool(
             requested_tool = load_tool_metadata(request_data.tool_id)
             request_inputs_dict = finalize_inputs(request_data.inputs, requested_tool['inputs'])
         
-            result = execute_tool(request_data.tool_id, request_inputs_dict)
+            result = await execute_tool(request_data.tool_id, request_inputs_dict)
         
         # Handle additional features 
         if youtube_url or files:
             try:
-                flashcards = dynamo_executor(youtube_url=youtube_url, files=files, verbose=True, max_flashcards=max_flashcards)
+                flashcards = await dynamo_executor(youtube_url=youtube_url, files=files, verbose=True, max_flashcards=max_flashcards)
                 result['flashcards'] = flashcards
             except Exception as e:
                 logger.error(f"Error processing content: {e}")
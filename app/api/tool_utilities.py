@@ -1,5 +1,6 @@
 import json
 import os
+import inspect
 from app.services.logger import setup_logger
 from app.services.tool_registry import ToolFile
 from app.api.error_utilities import VideoTranscriptError, InputValidationError, ToolExecutorError
@@ -123,7 +124,7 @@ def finalize_inputs(input_data, validate_data: List[Dict[str, str]]) -> Dict[str
     inputs = convert_files_to_tool_files(inputs)
     return inputs
 
-def execute_tool(tool_id, request_inputs_dict):
+async def execute_tool(tool_id, request_inputs_dict):
     try:
         tool_config = tools_config.get(str(tool_id))
         
@@ -133,7 +134,11 @@ def execute_tool(tool_id, request_inputs_dict):
         execute_function = get_executor_by_name(tool_config['path'])
         request_inputs_dict['verbose'] = True
         
-        return execute_function(**request_inputs_dict)
+        result = execute_function(**request_inputs_dict)
+        if inspect.isawaitable(result):
+            result = await result
+        
+        return result
     
     except VideoTranscriptError as e:
         logger.error(f"Failed to execute tool due to video transcript error: {str(e)}")
@@ -1,55 +1,60 @@
-from fastapi import UploadFile
+import os
+import asyncio
+from fastapi import UploadFile, HTTPException
 from app.services.logger import setup_logger
-from app.api.error_utilities import VideoTranscriptError
-from app.features.dynamo.tools import get_loader, summarize_transcript, generate_flashcards, summarize_documents
+from app.api.error_utilities import VideoTranscriptError, LoaderError
+from app.features.dynamo.tools import get_loader, summarize_transcript, generate_flashcards, generate_flashcards_from_files
+from app.features.dynamo.loaders.youtube_loader import YoutubeTranscriptLoader
 
 logger = setup_logger(__name__)
 
-def executor(youtube_url: str = None, files: list[UploadFile] = None, verbose=False, max_flashcards=10):
+# Bound how many files are loaded and processed at the same time
+FILE_CONCURRENCY = int(os.getenv("FILE_CONCURRENCY", "4"))
+file_semaphore = asyncio.Semaphore(FILE_CONCURRENCY)
+
+async def process_file(file: UploadFile, verbose=False, max_flashcards=10) -> list:
+    async with file_semaphore:
+        try:
+            logger.info(f"Processing file: {file.filename}")
+            loader_class = get_loader(file)
+            
+            # YouTube links submitted as files go through the transcript pipeline in this process
+            if loader_class is YoutubeTranscriptLoader:
+                summary = await summarize_transcript(file.filename, verbose=verbose)
+                return await generate_flashcards(summary, verbose=verbose, max_flashcards=max_flashcards)
+            
+            # Generate flashcards from the file's chunks in parallel
+            return await generate_flashcards_from_files(loader_class, [file], verbose=verbose, max_flashcards=max_flashcards)
+        except (LoaderError, VideoTranscriptError, HTTPException) as e:
+            logger.error(f"Error in processing {file.filename} -> {e}")
+            raise
+
+async def executor(youtube_url: str = None, files: list[UploadFile] = None, verbose=False, max_flashcards=10):
     sanitized_flashcards = []
 
     if youtube_url:
         try:
             logger.info(f"Processing YouTube URL: {youtube_url}")
-            summary = summarize_transcript(youtube_url, verbose=verbose)
+            summary = await summarize_transcript(youtube_url, verbose=verbose)
             logger.info(f"Summary for YouTube URL: {summary}")
-            flashcards = generate_flashcards(summary, max_flashcards=max_flashcards, verbose=verbose)
-            for flashcard in flashcards:
-                if 'concept' in flashcard and 'definition' in flashcard:
-                    sanitized_flashcards.append({
-                        "concept": flashcard['concept'],
-                        "definition": flashcard['definition']
-                    })
-                else:
-                    logger.warning(f"Malformed flashcard skipped: {flashcard}")
-        except VideoTranscriptError as e:
+            flashcards = await generate_flashcards(summary, max_flashcards=max_flashcards, verbose=verbose)
+            # The flashcard parser already validated and normalized every card
+            sanitized_flashcards.extend(flashcards)
+        except (VideoTranscriptError, HTTPException) as e:
             logger.error(f"Error in processing YouTube URL -> {e}")
-            raise ValueError(f"Error in processing YouTube URL: {e}")
-        except Exception as e:
-            logger.error(f"Error in executor: {e}")
-            raise ValueError(f"Error in executor: {e}")
+            raise
 
     if files:
-        for file in files:
-            try:
-                logger.info(f"Processing file: {file.filename}")
-                loader_class = get_loader(file)
-                
-                # Load document
-                loader = loader_class([file])
-                documents = loader.load()
-                logger.info(f"Documents loaded: {documents}")
-                
-                # Summarize document
-                summary = summarize_documents(documents)
-                logger.info(f"Summary for file {file.filename}: {summary}")
-                
-                # Generate flashcards
-                flashcards = generate_flashcards(summary, verbose=verbose, max_flashcards=max_flashcards)
-                sanitized_flashcards.extend(flashcards[:max_flashcards])
-            except Exception as e:
-                logger.error(f"Error in processing {file.filename} -> {e}")
-                raise ValueError(f"Error in processing {file.filename}: {e}")
+        tasks = [asyncio.create_task(process_file(file, verbose=verbose, max_flashcards=max_flashcards)) for file in files]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # gather leaves the other files running on failure, cancel them so they stop spending model calls
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        for flashcards in results:
+            sanitized_flashcards.extend(flashcards)
 
     return sanitized_flashcards
-
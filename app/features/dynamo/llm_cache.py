@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import orjson
+import numpy as np
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows, saves from separate processes are not locked there
+    fcntl = None
+from app.services.logger import setup_logger
+from app.api.error_utilities import CacheMissError
+
+logger = setup_logger(__name__)
+
+CACHE_MODES = ("enabled", "replay", "disabled")
+
+def make_cache_key(template: str, examples: str, model: str, text: str, **params) -> str:
+    """Builds a deterministic SHA256 key for an LLM call from everything that shapes its output."""
+    payload = orjson.dumps({"tmpl": template, "ex": examples, "model": model, "input": text, "params": params}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+class MemoryBackend:
+    """In-process LRU store for cached LLM responses."""
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key: str):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key: str, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+class FileBackend:
+    """Stores each cached value as a JSON file so it survives process restarts. Entries older than ttl seconds are ignored."""
+    def __init__(self, directory: str, ttl: int = None):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, key: str, value):
+        # A unique temp file per write, so workers storing the same key don't clobber each other
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(value, file)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+def get_backend():
+    backend = os.getenv("CACHE_BACKEND", "memory")
+    if backend == "file":
+        return FileBackend(os.getenv("CACHE_DIR", "/tmp/dynamo_llm_cache"))
+    if backend == "memory":
+        return MemoryBackend(int(os.getenv("CACHE_MAXSIZE", "256")))
+    raise ValueError(f"Unsupported CACHE_BACKEND: {backend}")
+
+class LLMCache:
+    """
+    Response cache for LLM chain calls.
+
+    The CACHE_MODE environment variable selects the policy:
+    - enabled: return cached responses on hit and store new ones on miss.
+    - replay: only serve cached responses and raise CacheMissError on miss, for reproducible re-runs.
+    - disabled: always call the model.
+    """
+    def __init__(self, backend=None, mode: str = None):
+        self.mode = mode or os.getenv("CACHE_MODE", "enabled")
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Unsupported CACHE_MODE: {self.mode}")
+        self.backend = backend or get_backend()
+
+    def get(self, key: str):
+        if self.mode == "disabled":
+            return None
+
+        value = self.backend.get(key)
+        if value is None and self.mode == "replay":
+            raise CacheMissError(f"No cached response for key {key} in replay mode")
+        if value is not None:
+            logger.info(f"LLM cache hit for key {key}")
+        return value
+
+    def set(self, key: str, value):
+        if self.mode != "enabled":
+            return
+        self.backend.set(key, value)
+
+class SemanticCache:
+    """
+    Embedding cache that serves stored responses for near-duplicate inputs.
+
+    Vectors are L2-normalized so an inner product is the cosine similarity. Entries are
+    scoped (e.g. by prompt template) so a hit never crosses prompts, expire after
+    SEMANTIC_CACHE_TTL seconds and are persisted under SEMANTIC_CACHE_DIR. New entries
+    are buffered by add() and written by save(), which holds a file lock while it merges
+    them into the file on disk, so concurrent saves from other workers are not lost.
+    """
+    def __init__(self, embeddings, threshold: float = None, ttl: int = None, directory: str = None):
+        self.embeddings = embeddings
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        self.ttl = ttl if ttl is not None else int(os.getenv("SEMANTIC_CACHE_TTL", "604800"))
+        self.directory = directory or os.getenv("SEMANTIC_CACHE_DIR", "/tmp/dynamo_semantic_cache")
+        self.path = os.path.join(self.directory, "semantic_cache.npz")
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.pending = []
+        self.vectors, self.entries = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None, []
+        try:
+            with np.load(self.path) as data:
+                vectors = data["vectors"]
+                entries = json.loads(str(data["entries"]))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable semantic cache at {self.path} -> {e}")
+            return None, []
+
+        if len(entries) != len(vectors):
+            logger.warning(f"Discarding inconsistent semantic cache at {self.path}")
+            return None, []
+
+        live = [i for i, entry in enumerate(entries) if not self._expired(entry)]
+        if not live:
+            return None, []
+        return vectors[live], [entries[i] for i in live]
+
+    def _write(self, vectors: np.ndarray, entries: list):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, vectors=vectors, entries=np.array(json.dumps(entries)))
+        os.replace(tmp_path, self.path)
+
+    def _expired(self, entry) -> bool:
+        return time.time() - entry["created"] > self.ttl
+
+    async def embed(self, texts: list) -> list:
+        vectors = np.asarray(await self.embeddings.aembed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return list(vectors / np.where(norms == 0, 1, norms))
+
+    def search(self, vector: np.ndarray, scope: str):
+        with self.lock:
+            vectors, entries = self.vectors, self.entries
+        if vectors is None:
+            return None
+
+        scores = vectors @ vector
+        for i in np.argsort(scores)[::-1]:
+            if scores[i] < self.threshold:
+                break
+            entry = entries[i]
+            if entry["scope"] == scope and not self._expired(entry):
+                logger.info(f"Semantic cache hit with similarity {scores[i]:.3f}")
+                return entry["response"]
+        return None
+
+    def add(self, vector: np.ndarray, scope: str, response):
+        row = vector.reshape(1, -1)
+        entry = {"scope": scope, "response": response, "created": time.time()}
+        with self.lock:
+            self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])
+            self.entries = self.entries + [entry]
+            self.pending.append((row, entry))
+
+    def save(self):
+        """Writes buffered entries to disk. Blocking, so call it off the event loop."""
+        # One writer per process at a time, otherwise a concurrent save could miss this one's rows
+        with self.save_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+
+            # Lock across processes so the read-merge-write below sees every other worker's save; _read drops expired rows
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{self.path}.lock", 'w') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                vectors, entries = self._read()
+                vectors = np.vstack(([] if vectors is None else [vectors]) + [row for row, _ in pending])
+                entries = entries + [entry for _, entry in pending]
+                self._write(vectors, entries)
+
+            with self.lock:
+                added = self.pending
+                self.vectors = np.vstack([vectors] + [row for row, _ in added])
+                self.entries = entries + [entry for _, entry in added]
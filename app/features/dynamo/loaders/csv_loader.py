@@ -1,4 +1,5 @@
 import csv
+import codecs
 from fastapi import UploadFile
 from langchain_core.documents import Document
 
@@ -13,8 +14,8 @@ class CSVLoader:
             full_text = []
             with upload_file.file as csv_file:
                 csv_file.seek(0)  
-                text = csv_file.read().decode('utf-8')  
-                reader = csv.reader(text.splitlines())
+                # Decode line by line instead of materializing the whole upload
+                reader = csv.reader(codecs.iterdecode(csv_file, 'utf-8'))
                 for row in reader:
                     full_text.append(", ".join(row))
             content = "\n".join(full_text)
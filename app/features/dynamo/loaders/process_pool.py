@@ -0,0 +1,48 @@
+import os
+import asyncio
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.services.logger import setup_logger
+from app.api.error_utilities import LoaderError
+
+# Kept free of model, cache and chain setup so spawned workers import only what parsing needs
+logger = setup_logger(__name__)
+
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+load_pool = None
+
+def load_documents(loader_class, sources: list) -> list:
+    # Runs in a worker process; loaders only need the file object and its name
+    files = [SimpleNamespace(filename=filename, file=open(path, 'rb')) for path, filename in sources]
+    try:
+        return loader_class(files).load()
+    finally:
+        for file in files:
+            file.file.close()
+
+def get_load_pool() -> ProcessPoolExecutor:
+    global load_pool
+    if load_pool is None:
+        # Spawn rather than fork, the server process runs model and gRPC threads
+        load_pool = ProcessPoolExecutor(max_workers=LOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return load_pool
+
+def shutdown_load_pool():
+    global load_pool
+    if load_pool is not None:
+        load_pool.shutdown(cancel_futures=True)
+        load_pool = None
+
+async def load_in_pool(loader_class, sources: list) -> list:
+    global load_pool
+    pool = get_load_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, load_documents, loader_class, sources)
+    except BrokenProcessPool as e:
+        # A crashed worker (e.g. OOM on a large file) breaks the pool for good, so replace it
+        logger.error(f"Document loader pool broke, rebuilding it -> {e}")
+        if load_pool is pool:
+            load_pool = None
+        raise LoaderError(f"Failed to load documents: a loader worker crashed") from e
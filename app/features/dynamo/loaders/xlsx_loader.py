@@ -11,10 +11,15 @@ class XLSXLoader:
 
         for upload_file in self.files:
             full_text = []
-            wb = openpyxl.load_workbook(upload_file.file)
-            for sheet in wb.worksheets:
-                for row in sheet.iter_rows(values_only=True):
-                    full_text.append(", ".join([str(cell) for cell in row]))
+            # Read-only mode streams rows instead of building the full cell tree
+            wb = openpyxl.load_workbook(upload_file.file, read_only=True)
+            try:
+                for sheet in wb.worksheets:
+                    for row in sheet.iter_rows(values_only=True):
+                        full_text.append(", ".join([str(cell) for cell in row]))
+            finally:
+                # Read-only workbooks keep the archive open until closed
+                wb.close()
             content = "\n".join(full_text)
             metadata = {"source": upload_file.filename}
             doc = Document(page_content=content, metadata=metadata)
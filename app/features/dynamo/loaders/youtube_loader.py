@@ -10,5 +10,5 @@ class YoutubeTranscriptLoader:
             loader = YoutubeLoader.from_youtube_url(self.url, add_video_info=True)
             docs = loader.load()
         except Exception as e:
-            raise VideoTranscriptError(f"No video found or failed to load transcript: {e}")
+            raise VideoTranscriptError(f"No video found or failed to load transcript: {e}", self.url)
         return docs
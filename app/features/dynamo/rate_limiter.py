@@ -0,0 +1,55 @@
+import time
+import asyncio
+from app.services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class RateLimiter:
+    """
+    Token-bucket limiter for model requests per minute (rpm) and tokens per minute (tpm).
+
+    Both buckets refill continuously. acquire() waits until the requests and their estimated
+    tokens fit in the budget, so concurrent callers are paced instead of triggering
+    provider-side rate-limit retries.
+    """
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_tokens = float(rpm)
+        self.token_tokens = float(tpm)
+        self.last_update = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60)
+        self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60)
+        self.last_update = now
+
+    async def acquire(self, estimated_tokens: int = 0, requests: int = 1):
+        # A single call can never need more than a full token bucket
+        estimated_tokens = min(estimated_tokens, self.tpm)
+
+        async with self.lock:
+            # Batches larger than the request bucket (e.g. a long map-reduce) are charged
+            # across refills instead of being capped at one bucket
+            while True:
+                self._refill()
+                batch = min(requests, self.rpm)
+                wait = max(
+                    (batch - self.request_tokens) * 60 / self.rpm,
+                    (estimated_tokens - self.token_tokens) * 60 / self.tpm,
+                    0,
+                )
+                if wait > 0:
+                    logger.info(f"Rate limit budget exhausted, waiting {wait:.2f}s")
+                    await asyncio.sleep(wait)
+                    self._refill()
+
+                self.request_tokens -= batch
+                self.token_tokens -= estimated_tokens
+                requests -= batch
+                estimated_tokens = 0
+                if requests <= 0:
+                    return
@@ -1,21 +1,37 @@
+import re
 import os
+import math
+import orjson
+import msgspec
+import tiktoken
+import shutil
+import asyncio
+import tempfile
+import itertools
+from typing import Annotated
 from dotenv import load_dotenv
 from fastapi import UploadFile, HTTPException
 from app.services.logger import setup_logger
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import GoogleGenerativeAI
+from langchain_google_genai import GoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers.format_instructions import JSON_FORMAT_INSTRUCTIONS
+from langchain_core.exceptions import OutputParserException
+from google.api_core.exceptions import GoogleAPIError
+from langchain_core.runnables import RunnableLambda
 from langchain.chains.summarize import load_summarize_chain
-from langchain_core.pydantic_v1 import BaseModel, Field
-from app.api.error_utilities import VideoTranscriptError
-from langchain_community.document_loaders import YoutubeLoader
+from app.api.error_utilities import VideoTranscriptError, LoaderError
+from app.features.dynamo.llm_cache import LLMCache, SemanticCache, FileBackend, make_cache_key
+from app.features.dynamo.rate_limiter import RateLimiter
 from app.features.dynamo.loaders.pdf_loader import PDFLoader
 from app.features.dynamo.loaders.docx_loader import DOCXLoader
 from app.features.dynamo.loaders.pptx_loader import PPTXLoader 
 from app.features.dynamo.loaders.xlsx_loader import XLSXLoader
 from app.features.dynamo.loaders.csv_loader import CSVLoader
-from app.features.dynamo.loaders.youtube_loader import YoutubeTranscriptLoader
+from app.features.dynamo.loaders.process_pool import load_in_pool
+from app.features.dynamo.loaders.youtube_loader import YoutubeLoader, YoutubeTranscriptLoader
 
 load_dotenv()
 
@@ -26,27 +42,43 @@ google_api_key = os.getenv("GOOGLE_API_KEY")
 if not google_api_key:
     raise ValueError("Please set the GOOGLE_API_KEY environment variable")
 
-model = GoogleGenerativeAI(model="gemini-1.0-pro", google_api_key=google_api_key)
+MODEL_NAME = "gemini-1.0-pro"
+model = GoogleGenerativeAI(model=MODEL_NAME, google_api_key=google_api_key)
+
+# Cache LLM responses so re-submitted content skips the model call
+llm_cache = LLMCache()
+
+# Optionally serve near-duplicate inputs from an embedding cache
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE", "disabled") == "enabled" and llm_cache.mode == "enabled":
+    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=google_api_key)
+    semantic_cache = SemanticCache(embeddings)
+
+# Keep fetched transcripts on disk so re-submitted videos skip YouTube entirely
+transcript_cache = FileBackend(
+    os.getenv("TRANSCRIPT_CACHE_DIR", "/tmp/yt_transcripts"),
+    ttl=int(os.getenv("TRANSCRIPT_CACHE_TTL", "604800"))
+)
+
+# Bound concurrent LLM calls across chunk fan-out
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Pace Gemini calls to stay under the project's request and token quotas
+rate_limiter = RateLimiter(rpm=int(os.getenv("GEMINI_RPM", "60")), tpm=int(os.getenv("GEMINI_TPM", "60000")))
 
 # Set up text splitter
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
 
-def get_loader(file: UploadFile):
-    filename = file.filename.lower()
-    if filename.endswith(".pdf"):
-        return PDFLoader
-    elif filename.endswith(".docx"):
-        return DOCXLoader
-    elif filename.endswith(".pptx"):
-        return PPTXLoader
-    elif filename.endswith(".csv"):
-        return CSVLoader
-    elif filename.endswith(".xlsx"):
-        return XLSXLoader
-    elif "youtube.com" in filename:
-        return YoutubeTranscriptLoader
-    else:
-        raise ValueError(f"Unsupported file type: {file.filename}")
+# Pack chunk groups by token count rather than a fixed number of chunks
+TOKEN_ENCODING = "cl100k_base"
+TARGET_TOKENS = int(os.getenv("TARGET_TOKENS", "6000"))
+# Loaded at startup by load_encoding; counts fall back to a characters / 4 estimate until then
+encoding = None
+
+class Flashcard(msgspec.Struct):
+    concept: Annotated[str, msgspec.Meta(description="The concept of the flashcard")]
+    definition: Annotated[str, msgspec.Meta(description="The definition of the flashcard")]
 
 def read_text_file(file_path):
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -55,36 +87,154 @@ def read_text_file(file_path):
     with open(absolute_file_path, 'r') as file:
         return file.read()
 
-def summarize_transcript(youtube_url: str, max_video_length=2000, verbose=False) -> str:
+# Load prompts and build the flashcard chain once instead of on every call
+TEMPLATE = read_text_file("prompt/dynamo-prompt.txt")
+EXAMPLES = read_text_file("prompt/examples.txt")
+
+JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+class OrjsonFlashcardParser(JsonOutputParser):
+    """JsonOutputParser that decodes complete model output with orjson, falling back to langchain's lenient parsing."""
+    def parse_result(self, result, *, partial=False):
+        if partial:
+            return super().parse_result(result, partial=partial)
+        
+        text = result[0].text.strip()
+        match = JSON_FENCE.search(text)
+        try:
+            output = orjson.loads(match.group(1) if match else text)
+        except orjson.JSONDecodeError:
+            output = super().parse_result(result, partial=partial)
+        
+        return validate_flashcards(output)
+
+def validate_flashcards(output) -> list:
+    cards, skipped = [], 0
+    for card in output if isinstance(output, list) else [output]:
+        try:
+            cards.append(msgspec.convert(card, Flashcard))
+        except msgspec.ValidationError:
+            skipped += 1
+    if skipped:
+        logger.warning(f"Skipped {skipped} malformed flashcards")
+    return msgspec.to_builtins(cards)
+
+# Render the Flashcard schema into format instructions a single time
+flashcard_schema = msgspec.json.schema(Flashcard)["$defs"]["Flashcard"]
+flashcard_schema = {key: value for key, value in flashcard_schema.items() if key not in ("title", "type")}
+FORMAT_INSTRUCTIONS = JSON_FORMAT_INSTRUCTIONS.format(schema=orjson.dumps(flashcard_schema).decode())
+
+parser = OrjsonFlashcardParser()
+
+cards_prompt = PromptTemplate(
+    template=TEMPLATE,
+    input_variables=["summary", "examples", "max_cards"],
+    partial_variables={"format_instructions": FORMAT_INSTRUCTIONS}
+)
+
+async def call_model(prompt_value, config):
+    # Pace and bound each model call inside the chain so abatch fan-out respects both limits
+    prompt = prompt_value.to_string()
+    await rate_limiter.acquire(estimated_tokens=len(prompt) // 4)
+    async with llm_semaphore:
+        return await model.ainvoke(prompt, config=config)
+
+cards_chain = cards_prompt | RunnableLambda(call_model) | parser
+
+# Reuse the shared model for summarization rather than rebuilding the chain per call
+summarize_chain = load_summarize_chain(llm=model, chain_type="map_reduce")
+
+LOADERS = {
+    ".pdf": PDFLoader,
+    ".docx": DOCXLoader,
+    ".pptx": PPTXLoader,
+    ".csv": CSVLoader,
+    ".xlsx": XLSXLoader,
+}
+
+def get_loader(file: UploadFile):
+    filename = file.filename.lower()
+    loader_class = LOADERS.get(os.path.splitext(filename)[1])
+    if loader_class:
+        return loader_class
+    if "youtube.com" in filename:
+        return YoutubeTranscriptLoader
+    raise LoaderError(f"Unsupported file type: {file.filename}")
+
+def load_encoding():
+    # tiktoken downloads the encoding on first use, so this must not run on the event loop
+    global encoding
+    try:
+        encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Tokenizer {TOKEN_ENCODING} unavailable, estimating tokens from length -> {e}")
+
+def count_tokens(parts: list) -> list:
+    if encoding is None:
+        return [len(part) // 4 for part in parts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(parts)]
+
+def pack_chunks(parts: list, token_counts: list, target_tokens: int) -> list:
+    groups, group, group_tokens = [], [], 0
+    for part, n_tokens in zip(parts, token_counts):
+        if group and group_tokens + n_tokens > target_tokens:
+            groups.append(" ".join(group))
+            group, group_tokens = [], 0
+        group.append(part)
+        group_tokens += n_tokens
+    if group:
+        groups.append(" ".join(group))
+    return groups
+
+def spool_upload(file: UploadFile) -> str:
+    # Upload handles can't be pickled, so hand them to worker processes as files on disk
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as spooled_file:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, spooled_file)
+        return spooled_file.name
+
+async def summarize_transcript(youtube_url: str, max_video_length=2000, verbose=False) -> str:
     try:
-        loader = YoutubeLoader.from_youtube_url(youtube_url, add_video_info=True)
-    except Exception as e:
+        video_id = YoutubeLoader.extract_video_id(youtube_url)
+    except ValueError as e:
         logger.error(f"No such video found at {youtube_url} -> {e}")
         raise VideoTranscriptError(f"No video found", youtube_url) from e
     
-    try:
-        docs = loader.load()
-        if not docs:
-            logger.error(f"No documents loaded from video at {youtube_url}")
-            raise VideoTranscriptError("No documents loaded from video", youtube_url)
-        
-        logger.info(f"Loaded documents: {docs}")
-        
-        length = docs[0].metadata.get("length")
-        title = docs[0].metadata.get("title")
-        if not length or not title:
-            logger.error(f"Missing metadata in video at {youtube_url}")
-            raise VideoTranscriptError("Missing metadata in video", youtube_url)
-    except Exception as e:
-        logger.error(f"Video transcript might be private or unavailable in 'en' or the URL is incorrect -> {e}")
-        raise VideoTranscriptError(f"No video transcripts available", youtube_url) from e
+    cache_key = f"yt-{video_id}"
+    cached_docs = transcript_cache.get(cache_key)
+    if cached_docs:
+        logger.info(f"Transcript cache hit for video {video_id}")
+        docs = [Document(**doc) for doc in cached_docs]
+    else:
+        loader = YoutubeLoader(video_id, add_video_info=True)
+        try:
+            docs = await asyncio.to_thread(loader.load)
+        except Exception as e:
+            # The YouTube libraries raise a range of unrelated types for private, missing or untranscribed videos
+            logger.error(f"Video transcript might be private or unavailable in 'en' or the URL is incorrect -> {e}")
+            raise VideoTranscriptError(f"No video transcripts available", youtube_url) from e
+    
+    if not docs:
+        logger.error(f"No documents loaded from video at {youtube_url}")
+        raise VideoTranscriptError("No documents loaded from video", youtube_url)
+    
+    logger.info(f"Loaded documents: {docs}")
+    
+    length = docs[0].metadata.get("length")
+    title = docs[0].metadata.get("title")
+    if not length or not title:
+        logger.error(f"Missing metadata in video at {youtube_url}")
+        raise VideoTranscriptError("Missing metadata in video", youtube_url)
+    
+    if not cached_docs:
+        transcript_cache.set(cache_key, [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
     
     if length > max_video_length:
         raise VideoTranscriptError(f"Video is {length} seconds long, please provide a video less than {max_video_length} seconds long", youtube_url)
 
-    split_docs = text_splitter.split_documents(docs)
+    split_docs = await asyncio.to_thread(text_splitter.split_documents, docs)
 
-    summary = summarize_documents(split_docs)
+    summary = await summarize_documents(split_docs)
     
     if verbose:
         logger.info(f"Found video with title: {title} and length: {length}")
@@ -93,38 +243,117 @@ def summarize_transcript(youtube_url: str, max_video_length=2000, verbose=False)
     
     return summary
 
-def summarize_documents(docs):
+async def summarize_documents(docs):
     logger.info("Starting document summarization using Map-Reduce chain.")
-    summarize_chain = load_summarize_chain(llm=model, chain_type="map_reduce")
-    result = summarize_chain.invoke(docs)
+    # str.join materializes a generator into a list anyway, so build the list directly
+    parts = [doc.page_content for doc in docs]
+    full_text = " ".join(parts)
+    cache_key = make_cache_key("summarize:map_reduce", "", MODEL_NAME, full_text)
+    summary = llm_cache.get(cache_key)
+    if summary is not None:
+        return summary
+    
+    # Map-reduce issues one call per document plus the combine step
+    await rate_limiter.acquire(estimated_tokens=len(full_text) // 4, requests=len(docs) + 1)
+    async with llm_semaphore:
+        result = await summarize_chain.ainvoke(docs)
     logger.info(f"Summarization result: {result}")
     
+    llm_cache.set(cache_key, result["output_text"])
     return result["output_text"]
 
-def generate_flashcards(summary: str, verbose=False, max_flashcards=10) -> list:
-    parser = JsonOutputParser(pydantic_object=Flashcard)
+async def invoke_cards_chain(summaries: list, max_cards: int) -> list:
+    cache_keys = [make_cache_key(TEMPLATE, EXAMPLES, MODEL_NAME, summary, max_cards=max_cards) for summary in summaries]
+    responses = [llm_cache.get(cache_key) for cache_key in cache_keys]
+    misses = [i for i, response in enumerate(responses) if response is None]
     
-    if verbose: logger.info(f"Beginning to process flashcards from summary")
+    if misses and semantic_cache:
+        scope = make_cache_key(TEMPLATE, EXAMPLES, MODEL_NAME, "", max_cards=max_cards)
+        vectors = dict(zip(misses, await semantic_cache.embed([summaries[i] for i in misses])))
+        for i in misses:
+            responses[i] = semantic_cache.search(vectors[i], scope)
+            if responses[i] is not None:
+                llm_cache.set(cache_keys[i], responses[i])
+        misses = [i for i in misses if responses[i] is None]
     
-    template = read_text_file("prompt/dynamo-prompt.txt")
-    examples = read_text_file("prompt/examples.txt")
+    if not misses:
+        return responses
     
-    cards_prompt = PromptTemplate(
-        template=template,
-        input_variables=["summary", "examples"],
-        partial_variables={"format_instructions": parser.get_format_instructions()}
+    # Keep the groups that succeeded; one bad output shouldn't discard the rest of the batch
+    results = await cards_chain.abatch(
+        [{"summary": summaries[i], "examples": EXAMPLES, "max_cards": max_cards} for i in misses],
+        config={"max_concurrency": LLM_CONCURRENCY},
+        return_exceptions=True
     )
     
-    cards_chain = cards_prompt | model | parser
+    failures = 0
+    for i, response in zip(misses, results):
+        if isinstance(response, (GoogleAPIError, OutputParserException)):
+            logger.error(f"Failed to generate flashcards for chunk group {i}: {response}")
+            responses[i] = []
+            failures += 1
+            continue
+        if isinstance(response, Exception):
+            raise response
+        
+        responses[i] = response
+        # An empty result (e.g. every card malformed) would otherwise be served forever without calling the model
+        if not response:
+            continue
+        llm_cache.set(cache_keys[i], response)
+        if semantic_cache:
+            semantic_cache.add(vectors[i], scope, response)
     
-    try:
-        response = cards_chain.invoke({"summary": summary, "examples": examples})
-    except Exception as e:
-        logger.error(f"Failed to generate flashcards: {e}")
+    if semantic_cache:
+        await asyncio.to_thread(semantic_cache.save)
+    
+    if failures == len(summaries):
         raise HTTPException(status_code=500, detail=f"Failed to generate flashcards from LLM")
     
-    return response[:max_flashcards]
+    return responses
 
-class Flashcard(BaseModel):
-    concept: str = Field(description="The concept of the flashcard") 
-    definition: str = Field(description="The definition of the flashcard")
\ No newline at end of file
+async def generate_flashcards(summary: str, verbose=False, max_flashcards=10) -> list:
+    if verbose: logger.info(f"Beginning to process flashcards from summary")
+    
+    responses = await invoke_cards_chain([summary], max_cards=max_flashcards)
+    return responses[0][:max_flashcards]
+
+async def generate_flashcards_from_files(loader_class, files: list[UploadFile], verbose=False, max_flashcards=10) -> list:
+    if max_flashcards <= 0:
+        return []
+    
+    # Parse in worker processes, document parsing is CPU-bound and holds the GIL
+    paths = []
+    try:
+        for file in files:
+            paths.append(await asyncio.to_thread(spool_upload, file))
+        documents = await load_in_pool(loader_class, [(path, file.filename) for path, file in zip(paths, files)])
+    finally:
+        for path in paths:
+            os.remove(path)
+    logger.info(f"Documents loaded: {documents}")
+    
+    split_docs = await asyncio.to_thread(text_splitter.split_documents, documents)
+    parts = [doc.page_content for doc in split_docs]
+    
+    # Tokenize every chunk in one batched call, then pack groups up to TARGET_TOKENS
+    token_counts = await asyncio.to_thread(count_tokens, parts)
+    
+    # Send every chunk group through one abatch call
+    summaries = pack_chunks(parts, token_counts, TARGET_TOKENS)
+    if not summaries:
+        return []
+    
+    # Every group yields at least one card, so never dispatch more groups than cards are needed.
+    # The groups left out are never read by the model; spacing the kept ones evenly only spreads
+    # the cards over the document, e.g. 10 cards from 40 groups skip three quarters of the text
+    if len(summaries) > max_flashcards:
+        summaries = [summaries[i * len(summaries) // max_flashcards] for i in range(max_flashcards)]
+    
+    # Split the flashcard budget across groups so the model doesn't generate cards we discard
+    max_cards = math.ceil(max_flashcards / len(summaries))
+    if verbose: logger.info(f"Generating up to {max_cards} flashcards from each of {len(summaries)} chunk groups")
+    
+    results = await invoke_cards_chain(summaries, max_cards=max_cards)
+    # Stop copying cards once the budget is met instead of flattening everything and slicing
+    return list(itertools.islice(itertools.chain.from_iterable(results), max_flashcards))
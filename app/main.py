@@ -6,8 +6,11 @@ from contextlib import asynccontextmanager
 from app.api.router import router
 from app.services.logger import setup_logger
 from app.api.error_utilities import ErrorResponse
+from app.features.dynamo.tools import load_encoding
+from app.features.dynamo.loaders.process_pool import shutdown_load_pool
 
 import os
+import asyncio
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv()) 
@@ -21,9 +24,11 @@ logger = setup_logger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info(f"Initializing Application Startup")
+    await asyncio.to_thread(load_encoding)
     logger.info(f"Successfully Completed Application Startup")
     
     yield
+    shutdown_load_pool()
     logger.info("Application shutdown")
 
 app = FastAPI(lifespan = lifespan)